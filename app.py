@@ -1,25 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g
+from flask import before_render_template, template_rendered
+from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from functools import wraps
 import os
+import time
+import validation
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///body_tracker.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['PROFILE_TEMPLATES'] = os.environ.get('PROFILE_TEMPLATES') == '1'
 
 db = SQLAlchemy(app)
 
 # Database Models
 class User(db.Model):
+    # Never reuse the id of a deleted user (the dashboard cache is keyed on it)
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     benchmark_measurement_id = db.Column(db.Integer, nullable=True)
+    # Bumped whenever the user's measurements or benchmark change (used as a cache key)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
     measurements = db.relationship('Measurement', backref='user', lazy=True, cascade='all, delete-orphan', foreign_keys='Measurement.user_id')
+    deleted_measurements = db.relationship('DeletedMeasurement', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -41,6 +51,13 @@ class Measurement(db.Model):
     bicep_circumference = db.Column(db.Float, nullable=True)
     thigh_circumference = db.Column(db.Float, nullable=True)
     chest_circumference = db.Column(db.Float, nullable=True)
+    quality_flags = db.Column(db.String(200), nullable=True)
+    # User's data_version when this entry was last added or changed (sync cursor)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @property
+    def flag_list(self):
+        return self.quality_flags.split(',') if self.quality_flags else []
     
     def to_dict(self):
         return {
@@ -55,9 +72,183 @@ class Measurement(db.Model):
             'hip_circumference': self.hip_circumference,
             'bicep_circumference': self.bicep_circumference,
             'thigh_circumference': self.thigh_circumference,
-            'chest_circumference': self.chest_circumference
+            'chest_circumference': self.chest_circumference,
+            'quality_flags': self.flag_list
         }
 
+class DeletedMeasurement(db.Model):
+    """Tombstone for a deleted entry, so synced clients can drop it too"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    measurement_id = db.Column(db.Integer, nullable=False)
+    data_version = db.Column(db.Integer, nullable=False)
+
+def recent_history(user_id, before):
+    """Recent entries (oldest first) used to check a new measurement against"""
+    recent = Measurement.query.filter(
+        Measurement.user_id == user_id,
+        Measurement.timestamp < before
+    ).order_by(Measurement.timestamp.desc()).limit(validation.OUTLIER_WINDOW * 2).all()
+    
+    history = [m.to_dict() for m in reversed(recent)
+               if not any(flag in validation.CONSISTENCY_FLAGS for flag in m.flag_list)]
+    return history[-validation.OUTLIER_WINDOW:]
+
+def bump_data_version(user_id):
+    """Mark the user's data as changed and return the new version (caller commits)
+
+    The increment runs in SQL so concurrent requests (e.g. several gunicorn
+    workers) each get their own version; SQLite holds the write lock until
+    the caller commits, so the value read back belongs to this transaction.
+    """
+    User.query.filter_by(id=user_id).update({User.data_version: User.data_version + 1})
+    return db.session.query(User.data_version).filter_by(id=user_id).scalar()
+
+def refresh_quality_flags(user_id):
+    """Re-check a user's whole history in one pass and store the flags (caller commits)"""
+    measurements = Measurement.query.filter_by(user_id=user_id).order_by(Measurement.timestamp).all()
+    results = validation.flag_series([m.to_dict() for m in measurements])
+    version = bump_data_version(user_id)
+    for measurement, flags in zip(measurements, results):
+        quality_flags = validation.format_flags(flags)
+        if measurement.quality_flags != quality_flags:
+            measurement.quality_flags = quality_flags
+            measurement.data_version = version
+
+def measurement_from_form(user_id, timestamp):
+    """Build a validated and flagged Measurement from the submitted form"""
+    def get_optional_float(field_name):
+        value = request.form.get(field_name)
+        return float(value) if value and value.strip() else None
+    
+    values = {
+        'weight': float(request.form.get('weight')),
+        'bmi': float(request.form.get('bmi')),
+        'body_fat_percentage': float(request.form.get('body_fat_percentage')),
+        'visceral_fat_index': float(request.form.get('visceral_fat_index')),
+        'lean_mass_percentage': float(request.form.get('lean_mass_percentage')),
+        'waist_circumference': get_optional_float('waist_circumference'),
+        'hip_circumference': get_optional_float('hip_circumference'),
+        'bicep_circumference': get_optional_float('bicep_circumference'),
+        'thigh_circumference': get_optional_float('thigh_circumference'),
+        'chest_circumference': get_optional_float('chest_circumference')
+    }
+    validation.validate_measurement(values)
+    flags = validation.flag_measurement(values, recent_history(user_id, timestamp))
+    
+    return Measurement(
+        user_id=user_id,
+        timestamp=timestamp,
+        quality_flags=validation.format_flags(flags),
+        **values
+    )
+
+def flash_quality_flags(measurement):
+    if measurement.quality_flags:
+        flash(f'Entry saved but flagged for review: {validation.describe_flags(measurement.flag_list)}. '
+              'It will be left out of charts and comparisons.', 'warning')
+
+# Template render timing (set PROFILE_TEMPLATES=1 to print each render)
+# template name -> [renders, total seconds]
+template_timings = {}
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_timers', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def stop_template_timer(sender, template, context, **extra):
+    timers = g.get('template_timers')
+    if not timers:
+        return
+    elapsed = time.perf_counter() - timers.pop()
+    stats = template_timings.setdefault(template.name, [0, 0.0])
+    stats[0] += 1
+    stats[1] += elapsed
+    if app.config['PROFILE_TEMPLATES']:
+        print(f"TEMPLATE {template.name}: {elapsed * 1000:.2f} ms")
+
+# Dashboard comparison rows: (label, key, value suffix, delta suffix, lower is better)
+DASHBOARD_METRICS = [
+    ('Weight', 'weight', ' kg', '', True),
+    ('Body Fat', 'body_fat_percentage', '%', '%', True),
+    ('Lean Mass', 'lean_mass_percentage', '%', '%', False),
+    ('BMI', 'bmi', '', '', True),
+    ('Visceral Fat', 'visceral_fat_index', '', '', True),
+    ('Muscle', 'muscle_mass', ' kg', '', False),
+    ('Fat', 'fat_mass', ' kg', '', True),
+]
+
+def metric_values(measurement):
+    values = measurement.to_dict()
+    values['muscle_mass'] = (measurement.lean_mass_percentage / 100) * measurement.weight
+    values['fat_mass'] = (measurement.body_fat_percentage / 100) * measurement.weight
+    return values
+
+def comparison_rows(latest, other):
+    """Precomputed values and deltas for one comparison box on the dashboard"""
+    latest_values = metric_values(latest)
+    other_values = metric_values(other)
+    rows = []
+    for label, key, value_suffix, diff_suffix, lower_is_better in DASHBOARD_METRICS:
+        diff = latest_values[key] - other_values[key]
+        if diff == 0:
+            status = 'neutral'
+        elif (diff < 0) == lower_is_better:
+            status = 'good'
+        else:
+            status = 'bad'
+        rows.append({
+            'label': label,
+            'other': other_values[key],
+            'latest': latest_values[key],
+            'diff': diff,
+            'value_suffix': value_suffix,
+            'diff_suffix': diff_suffix,
+            'status': status
+        })
+    return rows
+
+# Rendered dashboard summary cards: user_id -> ((user_id, username, data_version), html)
+# Keyed on the version stored in the database so every worker notices changes.
+# The username is part of the key because databases created before ids stopped
+# being reused can hand a deleted user's id (and version 0) to a new user.
+summary_cache = {}
+
+def summary_cache_key(user):
+    return (user.id, user.username, user.data_version)
+
+def render_dashboard_summary(user):
+    cached = summary_cache.get(user.id)
+    if cached and cached[0] == summary_cache_key(user):
+        return cached[1]
+    
+    # Flagged entries are left out of the comparisons
+    clean = Measurement.query.filter(
+        Measurement.user_id == user.id,
+        Measurement.quality_flags.is_(None)
+    ).order_by(Measurement.timestamp.desc()).limit(2).all()
+    latest = clean[0] if clean else None
+    previous = clean[1] if len(clean) > 1 else None
+    # Entries exist but every one of them is flagged
+    all_flagged = latest is None and Measurement.query.filter_by(user_id=user.id).first() is not None
+    
+    benchmark = None
+    if user.benchmark_measurement_id:
+        benchmark = Measurement.query.filter_by(id=user.benchmark_measurement_id, user_id=user.id).first()
+    
+    html = Markup(render_template(
+        'dashboard_summary.html',
+        latest=latest,
+        previous=previous,
+        benchmark=benchmark,
+        all_flagged=all_flagged,
+        previous_rows=comparison_rows(latest, previous) if previous else [],
+        benchmark_rows=comparison_rows(latest, benchmark) if latest and benchmark else []
+    ))
+    summary_cache[user.id] = (summary_cache_key(user), html)
+    return html
+
 # Authentication decorator
 def login_required(f):
     @wraps(f)
@@ -123,43 +314,20 @@ def dashboard():
         flash('Your account no longer exists. Please log in again.', 'danger')
         return redirect(url_for('login'))
     
-    measurements = Measurement.query.filter_by(user_id=user.id).order_by(Measurement.timestamp.desc()).all()
-    
-    print(f"DEBUG Dashboard: user={user.username}, benchmark_id={user.benchmark_measurement_id}")
-    print(f"DEBUG Dashboard: Total measurements={len(measurements)}")
-    if user.benchmark_measurement_id:
-        benchmark_found = any(m.id == user.benchmark_measurement_id for m in measurements)
-        print(f"DEBUG Dashboard: Benchmark found in measurements? {benchmark_found}")
-    
-    return render_template('dashboard.html', user=user, measurements=measurements)
+    return render_template('dashboard.html', user=user, summary_html=render_dashboard_summary(user))
 
 @app.route('/add-measurement', methods=['GET', 'POST'])
 @login_required
 def add_measurement():
     if request.method == 'POST':
         try:
-            # Helper function to get optional float
-            def get_optional_float(field_name):
-                value = request.form.get(field_name)
-                return float(value) if value and value.strip() else None
-            
-            measurement = Measurement(
-                user_id=session['user_id'],
-                timestamp=datetime.now(),  # Auto-set to current time
-                weight=float(request.form.get('weight')),
-                bmi=float(request.form.get('bmi')),
-                body_fat_percentage=float(request.form.get('body_fat_percentage')),
-                visceral_fat_index=float(request.form.get('visceral_fat_index')),
-                lean_mass_percentage=float(request.form.get('lean_mass_percentage')),
-                waist_circumference=get_optional_float('waist_circumference'),
-                hip_circumference=get_optional_float('hip_circumference'),
-                bicep_circumference=get_optional_float('bicep_circumference'),
-                thigh_circumference=get_optional_float('thigh_circumference'),
-                chest_circumference=get_optional_float('chest_circumference')
-            )
+            # Auto-set to current time
+            measurement = measurement_from_form(session['user_id'], datetime.now())
+            measurement.data_version = bump_data_version(session['user_id'])
             db.session.add(measurement)
             db.session.commit()
             flash('Measurement added successfully!', 'success')
+            flash_quality_flags(measurement)
             return redirect(url_for('dashboard'))
         except Exception as e:
             flash(f'Error adding measurement: {str(e)}', 'danger')
@@ -183,6 +351,13 @@ def trends():
     
     return render_template('trends.html', user=user)
 
+@app.route('/service-worker.js')
+def service_worker():
+    # Served from the root because a service worker only controls pages under its own path
+    response = app.send_static_file('js/service-worker.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/all-data')
 @login_required
 def all_data():
@@ -205,6 +380,38 @@ def get_measurements(user_id):
     measurements = Measurement.query.filter_by(user_id=user_id).order_by(Measurement.timestamp).all()
     return jsonify([m.to_dict() for m in measurements])
 
+@app.route('/api/measurements/<int:user_id>/sync')
+@login_required
+def sync_measurements(user_id):
+    """Entries added or changed (and IDs deleted) since the client's last synced version"""
+    if not session.get('is_admin') and session['user_id'] != user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Read the version before the entries: a write landing in between is sent
+    # now and again on the next sync, rather than skipped
+    user = User.query.get_or_404(user_id)
+    since = request.args.get('since', type=int)
+    
+    # No cursor, or one from a database that has since been reset: send everything
+    full = since is None or since > user.data_version
+    query = Measurement.query.filter_by(user_id=user_id)
+    deleted_ids = []
+    if not full:
+        query = query.filter(Measurement.data_version > since)
+        deleted = DeletedMeasurement.query.filter(
+            DeletedMeasurement.user_id == user_id,
+            DeletedMeasurement.data_version > since
+        ).all()
+        deleted_ids = [d.measurement_id for d in deleted]
+    
+    measurements = query.order_by(Measurement.timestamp).all()
+    return jsonify({
+        'version': user.data_version,
+        'full': full,
+        'measurements': [m.to_dict() for m in measurements],
+        'deleted_ids': deleted_ids
+    })
+
 @app.route('/admin')
 @admin_required
 def admin_panel():
@@ -254,6 +461,13 @@ def delete_measurement(measurement_id):
         return redirect(url_for('dashboard'))
     
     db.session.delete(measurement)
+    db.session.add(DeletedMeasurement(
+        user_id=measurement.user_id,
+        measurement_id=measurement.id,
+        data_version=bump_data_version(measurement.user_id)
+    ))
+    # Later entries lose this one from their rolling window
+    refresh_quality_flags(measurement.user_id)
     db.session.commit()
     flash('Measurement deleted successfully.', 'success')
     
@@ -273,6 +487,7 @@ def set_benchmark(measurement_id):
     
     user = User.query.get(session['user_id'])
     user.benchmark_measurement_id = measurement_id
+    bump_data_version(user.id)
     db.session.commit()
     
     print(f"DEBUG: Set benchmark for user {user.username} (id={user.id}) to measurement {measurement_id}")
@@ -286,6 +501,7 @@ def set_benchmark(measurement_id):
 def clear_benchmark():
     user = User.query.get(session['user_id'])
     user.benchmark_measurement_id = None
+    bump_data_version(user.id)
     db.session.commit()
     flash('Benchmark cleared.', 'info')
     return redirect(url_for('dashboard'))
@@ -323,31 +539,23 @@ def admin_add_entry():
 
     if request.method == 'POST':
         try:
-            def get_optional_float(field_name):
-                value = request.form.get(field_name)
-                return float(value) if value and value.strip() else None
-
             timestamp = datetime.strptime(request.form.get('timestamp'), '%Y-%m-%d')
             user_id = int(request.form.get('user_id'))
 
-            measurement = Measurement(
-                user_id=user_id,
-                timestamp=timestamp,
-                weight=float(request.form.get('weight')),
-                bmi=float(request.form.get('bmi')),
-                body_fat_percentage=float(request.form.get('body_fat_percentage')),
-                visceral_fat_index=float(request.form.get('visceral_fat_index')),
-                lean_mass_percentage=float(request.form.get('lean_mass_percentage')),
-                waist_circumference=get_optional_float('waist_circumference'),
-                hip_circumference=get_optional_float('hip_circumference'),
-                bicep_circumference=get_optional_float('bicep_circumference'),
-                thigh_circumference=get_optional_float('thigh_circumference'),
-                chest_circumference=get_optional_float('chest_circumference')
-            )
+            measurement = measurement_from_form(user_id, timestamp)
+            back_dated = Measurement.query.filter(
+                Measurement.user_id == user_id,
+                Measurement.timestamp > timestamp
+            ).first() is not None
+            measurement.data_version = bump_data_version(user_id)
             db.session.add(measurement)
+            if back_dated:
+                # Later entries now have this one in their rolling window
+                refresh_quality_flags(user_id)
             db.session.commit()
             user = User.query.get(user_id)
             flash(f'Entry added successfully for {user.username}!', 'success')
+            flash_quality_flags(measurement)
             return redirect(url_for('admin_panel'))
         except Exception as e:
             flash(f'Error adding entry: {str(e)}', 'danger')
@@ -367,6 +575,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    summary_cache.pop(user_id, None)
     flash(f'User "{username}" deleted successfully.', 'success')
     return redirect(url_for('admin_panel'))
 
@@ -0,0 +1,74 @@
+"""
+Benchmark dashboard render time for a user
+
+Usage:
+    python benchmark_dashboard.py <username> [runs]
+
+Prints the average time of:
+- a cold render (summary cards rebuilt from the database every time)
+- a warm render (summary cards served from the cache)
+and the per-template times collected by the render timing hook.
+
+To compare with an older version of dashboard.html, check out that commit
+and run the same command; on versions without the cache only the cold
+number is meaningful.
+"""
+
+import sys
+import time
+import app as body_tracker
+from app import app, User
+
+
+def time_requests(client, runs, clear_cache):
+    total = 0.0
+    for _ in range(runs):
+        if clear_cache:
+            getattr(body_tracker, 'summary_cache', {}).clear()
+        start = time.perf_counter()
+        response = client.get('/dashboard')
+        total += time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Dashboard returned {response.status_code}")
+    return total / runs * 1000
+
+
+def benchmark(username, runs):
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            print(f"Error: User '{username}' not found!")
+            return
+        user_id = user.id
+        is_admin = user.is_admin
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = username
+        sess['is_admin'] = is_admin
+
+    # First request warms up Jinja's compiled template cache
+    client.get('/dashboard')
+
+    cold = time_requests(client, runs, clear_cache=True)
+    timings = getattr(body_tracker, 'template_timings', {})
+    timings.clear()
+    warm = time_requests(client, runs, clear_cache=False)
+
+    print(f"\nDashboard render for {username} ({runs} runs)")
+    print("-" * 50)
+    print(f"Cold (no summary cache): {cold:.2f} ms")
+    print(f"Warm (summary cached):   {warm:.2f} ms")
+    if timings:
+        print("\nTemplate times (warm runs):")
+        for name, (count, total) in sorted(timings.items()):
+            print(f"  {name}: {total / count * 1000:.2f} ms avg over {count}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python benchmark_dashboard.py <username> [runs]")
+        sys.exit(1)
+
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else 100)
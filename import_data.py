@@ -21,7 +21,8 @@ Usage:
 import csv
 import sys
 from datetime import datetime
-from app import app, db, User, Measurement
+from app import app, db, User, Measurement, bump_data_version, refresh_quality_flags
+import validation
 
 def parse_date(date_str):
     """Try multiple date formats"""
@@ -59,6 +60,7 @@ def import_csv(csv_file, username):
             return
         
         print(f"Importing data for user: {username}")
+        version = bump_data_version(user.id)
         
         # Read CSV with UTF-8-sig to handle BOM
         with open(csv_file, 'r', encoding='utf-8-sig') as f:
@@ -96,8 +98,10 @@ def import_csv(csv_file, username):
                         hip_circumference=get_float('hip_circumference', 'hip'),
                         bicep_circumference=get_float('bicep_circumference', 'bicep'),
                         thigh_circumference=get_float('thigh_circumference', 'thigh'),
-                        chest_circumference=get_float('chest_circumference', 'chest')
+                        chest_circumference=get_float('chest_circumference', 'chest'),
+                        data_version=version
                     )
+                    validation.validate_measurement(measurement.to_dict())
                     
                     db.session.add(measurement)
                     imported += 1
@@ -107,12 +111,21 @@ def import_csv(csv_file, username):
                     print(f"Error on row {i}: {e}")
                     print(f"Row data: {row}")
             
+            # Flag the new rows against the rest of the history in one pass
+            db.session.flush()
+            refresh_quality_flags(user.id)
+            flagged = Measurement.query.filter(
+                Measurement.user_id == user.id,
+                Measurement.quality_flags.isnot(None)
+            ).count()
+            
             # Commit all at once
             db.session.commit()
             
             print(f"\nImport complete!")
             print(f"Successfully imported: {imported} measurements")
             print(f"Errors: {errors}")
+            print(f"Flagged for review (whole history): {flagged}")
 
 if __name__ == '__main__':
     if len(sys.argv) != 3:
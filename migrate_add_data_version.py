@@ -0,0 +1,28 @@
+"""
+Migration script to add data_version column to the user table
+(used to cache the dashboard summary cards)
+
+Talks to SQLite directly because importing app.py already reads the user table.
+
+Run this ONCE after updating the code:
+python migrate_add_data_version.py
+"""
+
+import os
+import sqlite3
+
+db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'body_tracker.db')
+
+try:
+    conn = sqlite3.connect(db_path)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(user)")]
+    
+    if 'data_version' in columns:
+        print("✓ data_version column already exists!")
+    else:
+        conn.execute("ALTER TABLE user ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+        conn.commit()
+        print("✓ Successfully added data_version column!")
+    conn.close()
+except Exception as e:
+    print(f"Error during migration: {e}")
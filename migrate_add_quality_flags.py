@@ -0,0 +1,36 @@
+"""
+Migration script to add quality_flags column to existing database
+and flag suspicious entries already stored
+
+Run this ONCE after updating the code:
+python migrate_add_quality_flags.py
+"""
+
+from app import app, db, User, Measurement, refresh_quality_flags
+from sqlalchemy import text
+
+with app.app_context():
+    try:
+        # Check if column already exists
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(measurement)"))
+            columns = [row[1] for row in result]
+            
+            if 'quality_flags' in columns:
+                print("✓ quality_flags column already exists!")
+            else:
+                conn.execute(text("ALTER TABLE measurement ADD COLUMN quality_flags VARCHAR(200)"))
+                conn.commit()
+                print("✓ Successfully added quality_flags column!")
+        
+        # Check every user's existing history
+        for user in User.query.all():
+            refresh_quality_flags(user.id)
+        db.session.commit()
+        
+        flagged = Measurement.query.filter(Measurement.quality_flags.isnot(None)).all()
+        print(f"✓ Flagged {len(flagged)} existing measurements for review")
+        for m in flagged:
+            print(f"  - {m.user.username} {m.timestamp.strftime('%Y-%m-%d')}: {m.quality_flags}")
+    except Exception as e:
+        print(f"Error during migration: {e}")
@@ -0,0 +1,29 @@
+"""
+Migration script to add data_version column to the measurement table
+(used by the trends page to sync only what changed)
+
+Run this ONCE after updating the code (after migrate_add_data_version.py):
+python migrate_add_sync.py
+
+The deleted_measurement table is created automatically when the app starts.
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+with app.app_context():
+    try:
+        # Check if column already exists
+        with db.engine.connect() as conn:
+            result = conn.execute(text("PRAGMA table_info(measurement)"))
+            columns = [row[1] for row in result]
+            
+            if 'data_version' in columns:
+                print("✓ data_version column already exists!")
+            else:
+                conn.execute(text("ALTER TABLE measurement ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+                print("✓ Successfully added data_version column!")
+                print("Note: Existing measurements are sent in full on the first sync")
+    except Exception as e:
+        print(f"Error during migration: {e}")
@@ -0,0 +1,66 @@
+// Keeps the trends page usable offline. Served from /service-worker.js by
+// app.py so it can control /trends. The data itself lives in IndexedDB
+// (see trends.html); this only caches the page and its assets.
+const PAGE_CACHE = 'body-tracker-pages';
+const ASSET_CACHE = 'body-tracker-assets-v1';
+const CHART_JS = 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js';
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(ASSET_CACHE)
+            .then(cache => cache.add(CHART_JS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key.startsWith('body-tracker-assets') && key !== ASSET_CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Chart.js and static files rarely change (style.css is versioned): cache first
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(ASSET_CACHE);
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+// The trends page: always try the network, fall back to the last copy
+async function networkFirst(request) {
+    try {
+        const response = await fetch(request);
+        // Don't keep the login page a logged-out visit redirects to
+        if (response.ok && !response.redirected) {
+            const cache = await caches.open(PAGE_CACHE);
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (e) {
+        const cached = await caches.match(request);
+        return cached || Response.error();
+    }
+}
+
+self.addEventListener('fetch', event => {
+    if (event.request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(event.request.url);
+    if (url.href === CHART_JS || (url.origin === self.location.origin && url.pathname.startsWith('/static/'))) {
+        event.respondWith(cacheFirst(event.request));
+    } else if (url.origin === self.location.origin && url.pathname === '/trends') {
+        event.respondWith(networkFirst(event.request));
+    }
+});
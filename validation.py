@@ -0,0 +1,179 @@
+"""
+Data-quality checks shared by the web forms, the admin entry form and the CSV importer
+
+Two kinds of checks:
+- Range checks reject values that cannot be right (e.g. a 840 kg weight typo)
+- Quality flags mark entries that are possible but suspicious (BMI that doesn't
+  match the weight, implausible body composition, sudden jumps against the
+  user's recent history). Flagged entries are still stored, and the flags are
+  saved with them so charts can leave them out without re-checking everything.
+"""
+
+import math
+import statistics
+from collections import deque
+
+# Hard limits - anything outside these is rejected
+RANGES = {
+    'weight': (20, 300),
+    'bmi': (10, 80),
+    'body_fat_percentage': (2, 75),
+    'visceral_fat_index': (1, 60),
+    'lean_mass_percentage': (10, 95),
+    'waist_circumference': (30, 250),
+    'hip_circumference': (30, 250),
+    'bicep_circumference': (10, 100),
+    'thigh_circumference': (20, 150),
+    'chest_circumference': (40, 250),
+}
+
+LABELS = {
+    'weight': 'Weight',
+    'bmi': 'BMI',
+    'body_fat_percentage': 'Body fat',
+    'visceral_fat_index': 'Visceral fat',
+    'lean_mass_percentage': 'Lean mass',
+    'waist_circumference': 'Waist',
+    'hip_circumference': 'Hip',
+    'bicep_circumference': 'Bicep',
+    'thigh_circumference': 'Thigh',
+    'chest_circumference': 'Chest',
+}
+
+# Height implied by weight / BMI must stay within this fraction of the usual value
+HEIGHT_TOLERANCE = 0.03
+HEIGHT_RANGE = (1.0, 2.5)
+
+CONSISTENCY_FLAGS = ('out_of_range', 'bmi_weight_mismatch', 'composition_implausible')
+
+# Rolling z-score settings
+OUTLIER_WINDOW = 10
+OUTLIER_MIN_HISTORY = 4
+OUTLIER_Z = 4
+# Smallest spread we trust, so a run of identical readings doesn't flag tiny changes
+MIN_STDEV = {
+    'weight': 1.5,
+    'bmi': 0.5,
+    'body_fat_percentage': 1.5,
+    'visceral_fat_index': 1.0,
+    'lean_mass_percentage': 1.5,
+    'waist_circumference': 1.5,
+    'hip_circumference': 1.5,
+    'bicep_circumference': 1.0,
+    'thigh_circumference': 1.5,
+    'chest_circumference': 1.5,
+}
+
+
+def out_of_range_fields(values):
+    """Fields whose value is outside RANGES (or not a number)"""
+    fields = []
+    for field, (low, high) in RANGES.items():
+        value = values.get(field)
+        if value is None:
+            continue
+        if math.isnan(value) or not low <= value <= high:
+            fields.append(field)
+    return fields
+
+
+def validate_measurement(values):
+    """Raise ValueError if any value is outside its allowed range"""
+    errors = []
+    for field in out_of_range_fields(values):
+        low, high = RANGES[field]
+        errors.append(f"{LABELS[field]} must be between {low} and {high} (got {values[field]:g})")
+
+    if errors:
+        raise ValueError('; '.join(errors))
+
+
+def implied_height(values):
+    """Height in metres implied by weight and BMI (None if either isn't positive)"""
+    if not (values['weight'] > 0 and values['bmi'] > 0):
+        return None
+    return math.sqrt(values['weight'] / values['bmi'])
+
+
+def _row_flags(values, window):
+    flags = []
+
+    # Rows stored before the range checks existed can hold anything (e.g. a BMI of 0)
+    if out_of_range_fields(values):
+        flags.append('out_of_range')
+
+    # BMI vs weight: the implied height should be plausible and match the history
+    height = implied_height(values)
+    heights = [h for h in (implied_height(row) for row in window) if h is not None]
+    if height is None:
+        flags.append('bmi_weight_mismatch')
+    elif heights:
+        usual_height = statistics.median(heights)
+        if abs(height - usual_height) > usual_height * HEIGHT_TOLERANCE:
+            flags.append('bmi_weight_mismatch')
+    elif not HEIGHT_RANGE[0] <= height <= HEIGHT_RANGE[1]:
+        flags.append('bmi_weight_mismatch')
+
+    # Body fat and lean mass can't add up to more than the whole body
+    if values['body_fat_percentage'] + values['lean_mass_percentage'] > 100.5:
+        flags.append('composition_implausible')
+
+    # Rolling z-score against the recent entries
+    if len(window) >= OUTLIER_MIN_HISTORY:
+        for field in RANGES:
+            value = values.get(field)
+            if value is None:
+                continue
+            recent = [row[field] for row in window if row.get(field) is not None]
+            if len(recent) < OUTLIER_MIN_HISTORY:
+                continue
+            stdev = max(statistics.pstdev(recent), MIN_STDEV[field])
+            if abs(value - statistics.fmean(recent)) / stdev > OUTLIER_Z:
+                flags.append(f'outlier:{field}')
+
+    return flags
+
+
+def flag_measurement(values, history):
+    """Quality flags for one new entry, given the user's recent consistent entries (oldest first)"""
+    # Stored flags may predate the range checks, so drop bad rows here as well
+    window = [row for row in history if not out_of_range_fields(row)]
+    return _row_flags(values, window[-OUTLIER_WINDOW:])
+
+
+def flag_series(rows):
+    """Quality flags for a whole history (oldest first) in a single pass
+
+    Returns one list of flags per row. Rows with inconsistent values are kept out
+    of the rolling window; outliers stay in it so a real change in level (e.g.
+    after a long break) stops being flagged once it repeats.
+    """
+    window = deque(maxlen=OUTLIER_WINDOW)
+    results = []
+    for values in rows:
+        flags = _row_flags(values, window)
+        if not any(flag in CONSISTENCY_FLAGS for flag in flags):
+            window.append(values)
+        results.append(flags)
+    return results
+
+
+def format_flags(flags):
+    """Flags as stored in the database (None when the entry is clean)"""
+    return ','.join(flags) if flags else None
+
+
+def describe_flags(flags):
+    """Human-readable summary for flash messages"""
+    descriptions = []
+    for flag in flags:
+        if flag == 'out_of_range':
+            descriptions.append('some values are outside the allowed ranges')
+        elif flag == 'bmi_weight_mismatch':
+            descriptions.append("BMI doesn't match the weight")
+        elif flag == 'composition_implausible':
+            descriptions.append('body fat + lean mass is over 100%')
+        elif flag.startswith('outlier:'):
+            field = flag.split(':', 1)[1]
+            descriptions.append(f"{LABELS[field].lower()} is unusual compared to recent entries")
+    return ', '.join(descriptions)